@@ -0,0 +1,54 @@
+"""
+audio_denoise 的 numba 核函数。
+本模块不参与 Cython 编译 (见 setup.py 的 NOISEREDUCE_CYTHONIZE_CLI)，
+Cython 编译后的函数没有 Python 字节码，numba 无法 JIT。
+"""
+
+try:
+    import numba
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+if NUMBA_AVAILABLE:
+    @numba.njit(parallel=True, fastmath=True, cache=True)
+    def _stationary_mask(sig_db, noise_thresh, prop_decrease,
+                         freq_filter, time_filter, tmp, out):
+        """
+        计算平稳掩码并完成平滑，结果写入 out。所有数组均为 (帧数, 频点数) 的 C 连续布局，
+        以 prange 按帧并行，内层循环沿频点连续访问内存。
+        平滑滤波器是频率/时间两个一维窗的外积，因此分两趟做一维卷积 (零填充，等价于
+        fftconvolve(mode="same"))：out 先存放 0/1 混合后的掩码，频率方向平滑写入 tmp，
+        时间方向平滑写回 out。
+        """
+        n_frames, n_bins = sig_db.shape
+        n_freq = freq_filter.shape[0]
+        n_time = time_filter.shape[0]
+        c_freq = (n_freq - 1) // 2
+        c_time = (n_time - 1) // 2
+        keep = 1.0 - prop_decrease
+        
+        # 阈值判定，按 prop_decrease 混合
+        for t in numba.prange(n_frames):
+            for k in range(n_bins):
+                out[t, k] = keep + prop_decrease if sig_db[t, k] > noise_thresh[k] else keep
+        
+        # 频率方向平滑
+        for t in numba.prange(n_frames):
+            for k in range(n_bins):
+                tmp[t, k] = 0.0
+            for j in range(n_freq):
+                w = freq_filter[j]
+                shift = c_freq - j
+                for k in range(max(0, -shift), min(n_bins, n_bins - shift)):
+                    tmp[t, k] += w * out[t, k + shift]
+        
+        # 时间方向平滑
+        for t in numba.prange(n_frames):
+            for k in range(n_bins):
+                out[t, k] = 0.0
+            for j in range(max(0, t + c_time - n_frames + 1), min(n_time, t + c_time + 1)):
+                w = time_filter[j]
+                tt = t + c_time - j
+                for k in range(n_bins):
+                    out[t, k] += w * tmp[tt, k]
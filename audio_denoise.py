@@ -1,18 +1,48 @@
+# cython: language_level=3, infer_types=True
 """
 noisereduce 高级音频降噪工具 - 支持指定噪声样本位置
 用法: python audio_denoise_advanced.py [选项] <输入文件或目录>
 """
 
 import argparse
+import functools
+import hashlib
 import os
 import sys
+import tempfile
 import time
 import numpy as np
+import scipy.fft
 import noisereduce as nr
 import soundfile as sf
 from pathlib import Path
+from scipy.signal import fftconvolve, get_window, stft, istft
+from noisereduce.spectralgate.base import _smoothing_filter
 from tqdm import tqdm
 import re
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+try:
+    import pyfftw
+    import pyfftw.interfaces.cache
+    import pyfftw.interfaces.scipy_fft
+    PYFFTW_AVAILABLE = True
+except ImportError:
+    PYFFTW_AVAILABLE = False
+
+# 可选: 通过 setup.py 用 Cython 编译本模块 (见 NOISEREDUCE_CYTHONIZE_CLI)。
+# 局部变量上的 cython.* 类型注解在解释执行时不会求值，未安装 Cython 时照常运行
+try:
+    import cython
+except ImportError:
+    pass
+
+# numba 核函数位于不参与 Cython 编译的独立模块，本模块编译后仍可 JIT
+from _denoise_kernels import NUMBA_AVAILABLE
+if NUMBA_AVAILABLE:
+    import numba
+    from _denoise_kernels import _stationary_mask
 
 # 声音类型预设参数
 PROFILE_SETTINGS = {
@@ -55,9 +85,238 @@ PROFILE_SETTINGS = {
         "win_length": 1024,
         "hop_length": 256,
         "n_std_thresh_stationary": 1.7
+    },
+    "boxcar": {
+        "stationary": True,
+        "prop_decrease": 0.95,
+        "n_fft": 1024,
+        "win_length": 1024,
+        "hop_length": 256,
+        "n_std_thresh_stationary": 1.7,
+        "window": "boxcar"
     }
 }
 
+# 掩码平滑参数，与 nr.reduce_noise 的默认值保持一致
+FREQ_MASK_SMOOTH_HZ = 500
+TIME_MASK_SMOOTH_MS = 50
+
+# STFT 前在信号两端补零的长度，与 nr.reduce_noise 的默认 padding 一致，
+# 保证帧对齐与掩码平滑在信号边缘的行为相同，且 iSTFT 结果覆盖完整信号
+STFT_PADDING = 30000
+
+# 以 float32 表示的 float64 eps 与 dB 动态范围，与 noisereduce 的 _amp_to_db 一致，
+# 同时避免 dB 计算升为 float64
+_DB_EPS = np.float32(np.finfo(np.float64).eps)
+_TOP_DB = np.float32(80.0)
+
+def _noise_digest(noise_clip):
+    """噪声片段的内容摘要，作为噪声统计量缓存键的一部分"""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(noise_clip.dtype.str.encode())
+    h.update(np.ascontiguousarray(noise_clip).data)
+    return h.digest()
+
+def _stft_kwargs(params):
+    """将预设参数转换为 scipy.signal.stft/istft 的参数"""
+    return {
+        "window": params.get("window", "hann"),
+        "nfft": params["n_fft"],
+        "nperseg": params["win_length"],
+        "noverlap": params["win_length"] - params["hop_length"],
+    }
+
+# 每个进程各自持有的可复用缓冲区 (补零信号/分帧/dB/掩码)，只在遇到更大的块时重新分配
+_SCRATCH = {"padded": None, "frames": None, "db": None, "mask": None, "mask_tmp": None}
+
+def _scratch(name, shape, dtype):
+    """返回缓冲区 name 中形状为 shape 的连续视图，容量不足或类型不符时才重新分配"""
+    size = int(np.prod(shape))
+    buf = _SCRATCH[name]
+    if buf is None or buf.dtype != dtype or buf.size < size:
+        buf = np.empty(size, dtype=dtype)
+        _SCRATCH[name] = buf
+    return buf[:size].reshape(shape)
+
+@functools.lru_cache(maxsize=8)
+def _window(window, n_fft, dtype):
+    """窗函数 (与 scipy.signal.stft 相同的周期窗)，矩形窗返回 None 表示无需乘窗"""
+    if window == "boxcar":
+        return None
+    return get_window(window, n_fft).astype(dtype)
+
+def _stft(y, params, pad=0):
+    """
+    计算两端各补 pad 个零后的 STFT，与 scipy.signal.stft(np.pad(y, pad), padded=False) 一致，
+    但返回 (帧数, 频点数) 布局 (scipy 结果的转置)。
+    win_length == n_fft 时补零 (含帧居中所需的 n_fft // 2) 只做一次并写入可复用的缓冲区，
+    直接分帧后做 rfft；乘窗结果写入可复用的缓冲区并允许变换就地覆盖，矩形窗时省去乘窗。
+    变换输出不复用缓冲区: NumPy >= 2.0 的 np.fft.rfft(out=) 虽可写入预分配数组，但对多帧逐行
+    变换，比跨帧向量化的 scipy.fft.rfft (安装 pyFFTW 时走其后端) 慢约 4 倍，得不偿失。
+    """
+    stft_kwargs = _stft_kwargs(params)
+    n_fft = params["n_fft"]
+    if params["win_length"] != n_fft or len(y) + 2 * pad < n_fft:
+        return stft(np.pad(y, pad), padded=False, **stft_kwargs)[2].T
+    
+    edge = pad + n_fft // 2
+    y_padded = _scratch("padded", (len(y) + 2 * edge,), y.dtype)
+    y_padded[:edge] = 0
+    y_padded[edge:edge + len(y)] = y
+    y_padded[edge + len(y):] = 0
+    frames = np.lib.stride_tricks.sliding_window_view(y_padded, n_fft)[::params["hop_length"]]
+    window = _window(stft_kwargs["window"], n_fft, y.dtype)
+    if window is None:
+        x = frames
+        scale = n_fft
+    else:
+        x = _scratch("frames", frames.shape, y.dtype)
+        np.multiply(frames, window, out=x)
+        scale = window.sum()
+    S = scipy.fft.rfft(x, axis=-1, overwrite_x=window is not None)
+    # 与 scipy 的 scaling="spectrum" 一致 (除以窗函数之和)
+    S /= scale
+    return S
+
+def _stft_db(S):
+    """
+    将 (帧数, 频点数) 的 STFT 转换为 dB，与 _amp_to_db(S.T, eps=_DB_EPS) 的结果一致
+    (每个频点的下限为其最大值减 _TOP_DB)，各步就地写入可复用的缓冲区而不产生临时数组。
+    返回值在下一次调用时会被覆盖。
+    """
+    db = _scratch("db", S.shape, np.float32)
+    np.abs(S, out=db)
+    db += _DB_EPS
+    np.log10(db, out=db)
+    db *= 20
+    floor = db.max(axis=0)
+    floor -= _TOP_DB
+    np.maximum(db, floor, out=db)
+    return db
+
+# 噪声统计量缓存: (预设名, 采样率, 噪声摘要) -> 统计量，按最近使用顺序淘汰。
+# 键中只有摘要而不引用噪声数组本身，缓存不会让已处理文件的噪声片段常驻内存
+_NOISE_PROFILE_CACHE = {}
+_NOISE_PROFILE_CACHE_SIZE = 32
+
+def _noise_profile(profile_key, sr, noise_clip):
+    """返回噪声片段每个频点的 dB 均值、标准差及掩码平滑滤波器，相同噪声片段只计算一次"""
+    key = (profile_key, sr, _noise_digest(noise_clip))
+    profile = _NOISE_PROFILE_CACHE.pop(key, None)
+    if profile is None:
+        profile = _compute_noise_profile(profile_key, sr, noise_clip)
+        if len(_NOISE_PROFILE_CACHE) >= _NOISE_PROFILE_CACHE_SIZE:
+            del _NOISE_PROFILE_CACHE[next(iter(_NOISE_PROFILE_CACHE))]
+    # 重新插入到末尾，字典的插入顺序即最近使用顺序
+    _NOISE_PROFILE_CACHE[key] = profile
+    return profile
+
+def _compute_noise_profile(profile_key, sr, noise_clip):
+    """计算噪声片段每个频点的 dB 均值、标准差及掩码平滑滤波器"""
+    params = PROFILE_SETTINGS[profile_key]
+    noise_stft_db = _stft_db(_stft(noise_clip, params))
+    noise_mean_db = np.mean(noise_stft_db, axis=0)
+    noise_std_db = np.std(noise_stft_db, axis=0)
+    
+    n_grad_freq = max(1, int(FREQ_MASK_SMOOTH_HZ / (sr / (params["n_fft"] / 2))))
+    n_grad_time = max(1, int(TIME_MASK_SMOOTH_MS / ((params["hop_length"] / sr) * 1000)))
+    if n_grad_freq == 1 and n_grad_time == 1:
+        smoothing = None
+    else:
+        smoothing = _smoothing_filter(n_grad_freq, n_grad_time).astype(np.float32)
+    return noise_mean_db, noise_std_db, smoothing
+
+def _reduce_noise_cached(audio, sr, profile_key, noise_clip):
+    """
+    平稳降噪的本地实现，复用缓存的噪声统计量，避免对相同噪声片段重复计算 STFT。
+    整个流程保持 float32/complex64；非平稳预设不依赖噪声片段统计量，直接调用 nr.reduce_noise。
+    """
+    audio = np.asarray(audio, dtype=np.float32)
+    noise_clip = np.asarray(noise_clip, dtype=np.float32)
+    params = PROFILE_SETTINGS[profile_key]
+    if not params["stationary"]:
+        nr_params = {k: v for k, v in params.items() if k != "window"}
+        # 分块已由调用方 (流式处理) 完成，整块一次处理，避免库内部再按 chunk_size 切分产生接缝
+        return nr.reduce_noise(y=audio, y_noise=noise_clip, sr=sr,
+                               chunk_size=len(audio), **nr_params)
+    
+    noise_mean_db, noise_std_db, smoothing = _noise_profile(profile_key, sr, noise_clip)
+    n_std_thresh = params["n_std_thresh_stationary"]
+    prop_decrease = params["prop_decrease"]
+    
+    # STFT、dB 与掩码均为 (帧数, 频点数) 的 C 连续布局，无需转置拷贝
+    sig_stft = _stft(audio, params, pad=STFT_PADDING)
+    sig_db = _stft_db(sig_stft)
+    
+    # 信号高于阈值的位置保留，其余按 prop_decrease 衰减
+    noise_thresh = noise_mean_db + noise_std_db * n_std_thresh
+    if NUMBA_AVAILABLE:
+        if smoothing is None:
+            freq_filter = time_filter = np.ones(1, dtype=np.float32)
+        else:
+            # 平滑滤波器可分离: 行/列求和即为两个归一化的一维窗
+            freq_filter = smoothing.sum(axis=1)
+            time_filter = smoothing.sum(axis=0)
+        sig_mask = _scratch("mask", sig_db.shape, np.float32)
+        _stationary_mask(sig_db, noise_thresh, prop_decrease, freq_filter, time_filter,
+                         _scratch("mask_tmp", sig_db.shape, np.float32), sig_mask)
+    else:
+        sig_mask = (sig_db > noise_thresh).astype(np.float32)
+        sig_mask *= prop_decrease
+        sig_mask += 1.0 - prop_decrease
+        if smoothing is not None:
+            # 平滑滤波器为 (频点, 帧) 布局，转置后与掩码布局一致
+            sig_mask = fftconvolve(sig_mask, smoothing.T, mode="same")
+    
+    sig_stft *= sig_mask
+    _, denoised = istft(sig_stft.T, **_stft_kwargs(params))
+    return denoised[STFT_PADDING:STFT_PADDING + len(audio)].astype(audio.dtype, copy=False)
+
+# 非负浮点数 (与 float() 一致，支持 "5."、".5" 与科学计数法 "1e1")
+_NUM = r'(?:\d+(?:\.\d*)?|\.\d+)(?:e[+-]?\d+)?'
+
+# 噪声位置格式: 关键字 / 百分比 / 时间段 / 单一时间点，"-" 与 "%" 两侧允许空白
+_TIME_RE = re.compile(
+    r'^\s*(?:(?P<kw>start|end)'
+    rf'|(?P<pct>{_NUM})\s*%'
+    rf'|(?P<a>{_NUM})\s*-\s*(?P<b>{_NUM})'
+    rf'|(?P<pt>{_NUM}))\s*$',
+    re.IGNORECASE
+)
+
+def _fixed_range(start, end, total_duration):
+    """与总时长无关的固定时间范围"""
+    return (start, end)
+
+def _end_range(total_duration):
+    """结尾1秒"""
+    return (total_duration - 1.0, total_duration)
+
+def _percent_range(percent, total_duration):
+    """总时长的百分比，默认从开头取"""
+    return (0.0, total_duration * percent / 100.0)
+
+# 按 m.lastgroup (最后闭合的命名组) 分派，时间段格式的最后一组为 "b"
+_TIME_RANGE_HANDLERS = {
+    "kw": lambda m: functools.partial(_fixed_range, 0.0, 1.0)
+                    if m["kw"].lower() == "start" else _end_range,
+    "pct": lambda m: functools.partial(_percent_range, float(m["pct"])),
+    "b": lambda m: functools.partial(_fixed_range, float(m["a"]), float(m["b"])),
+    "pt": lambda m: functools.partial(_fixed_range, float(m["pt"]),
+                                      float(m["pt"]) + 1.0),  # 默认取1秒
+}
+
+def compile_time_range(time_str):
+    """
+    预先解析时间范围字符串，返回 total_duration -> (start, end) 的函数。
+    返回值可被序列化，批处理时只需在主进程解析一次。
+    """
+    m = _TIME_RE.match(time_str)
+    if m is None:
+        print(f"⚠️ 无法解析时间范围: {time_str}, 使用默认开头1秒")
+        return functools.partial(_fixed_range, 0.0, 1.0)
+    return _TIME_RANGE_HANDLERS[m.lastgroup](m)
+
 def parse_time_range(time_str, total_duration):
     """
     解析时间范围字符串，支持多种格式：
@@ -66,79 +325,223 @@ def parse_time_range(time_str, total_duration):
     - "10.5-12.0": 从10.5秒到12.0秒
     - "5%": 总时长的5%作为噪声样本
     """
-    try:
-        # 处理特殊关键字
-        if time_str.lower() == "start":
-            return (0.0, 1.0)
-        elif time_str.lower() == "end":
-            return (total_duration - 1.0, total_duration)
-        
-        # 处理百分比格式
-        if '%' in time_str:
-            percent = float(time_str.strip('%')) / 100.0
-            duration = total_duration * percent
-            return (0.0, duration)  # 默认从开头取
-        
-        # 处理时间范围格式
-        if '-' in time_str:
-            start, end = map(float, time_str.split('-'))
-            return (start, end)
-        
-        # 单一时间点
-        position = float(time_str)
-        return (position, position + 1.0)  # 默认取1秒
-    
-    except Exception:
-        print(f"⚠️ 无法解析时间范围: {time_str}, 使用默认开头1秒")
-        return (0.0, 1.0)
+    return compile_time_range(time_str)(total_duration)
 
-def extract_noise_clip(audio, sr, time_range, total_duration):
-    """根据时间范围提取噪声片段"""
+# 流式处理的分块长度(秒)，相邻块的重叠填充由 _block_layout 按预设计算，拼接时裁掉
+BLOCK_SECONDS = 30
+# nr.reduce_noise 的 time_constant_s 默认值 (预设未覆盖时使用)
+NR_TIME_CONSTANT_S = 2.0
+# 非平稳预设的块填充为噪声底时间常数的倍数 (IIR 平滑的边界影响按指数衰减)。
+# 填充越长接缝越小，但在内存受限的块长下重叠部分的重复计算越多：
+# 1 倍时间常数时接缝误差约为峰值的 6%，3 倍时约 0.8% (库默认 chunk 拼接约 13%)
+NONSTATIONARY_PADDING_TIME_CONSTANTS = 1
+# 块长至少为单侧填充的倍数，使重叠部分的重复计算不超过约 13%。
+# nr.reduce_noise 非平稳降噪每个采样约占 260 字节内存，块长直接决定峰值内存
+BLOCK_MIN_PADDINGS = 15
+
+def _block_layout(profile_key, sr):
+    """
+    返回 (块长, 单侧填充) 的采样数。填充需覆盖降噪在时间方向上的影响范围：
+    平稳预设为掩码时间平滑的支撑长度，非平稳预设为若干倍噪声底时间常数。
+    两者都取 hop_length 的整数倍，使每块的 STFT 帧与整段处理时对齐。
+    """
+    params = PROFILE_SETTINGS[profile_key]
+    hop = params["hop_length"]
+    if params["stationary"]:
+        n_grad_time = max(1, int(TIME_MASK_SMOOTH_MS / ((hop / sr) * 1000)))
+        pad = (n_grad_time + 1) * hop + params["n_fft"]
+    else:
+        time_constant_s = params.get("time_constant_s", NR_TIME_CONSTANT_S)
+        pad = int(np.ceil(NONSTATIONARY_PADDING_TIME_CONSTANTS * time_constant_s * sr))
+    pad = -(-pad // hop) * hop
+    blocksize = max(int(BLOCK_SECONDS * sr), BLOCK_MIN_PADDINGS * pad)
+    blocksize = -(-blocksize // hop) * hop
+    return blocksize, pad
+
+def _to_mono(audio):
+    """
+    将 (帧数, 声道数) 的 float32 音频转换为单声道。
+    立体声写入预分配数组后原地乘 0.5，多声道用 np.add.reduce 求和后原地缩放，均不产生额外临时数组。
+    """
+    n_channels = audio.shape[1]
+    if n_channels == 1:
+        return audio[:, 0]
+    if n_channels == 2:
+        mono = np.empty(audio.shape[0], dtype=np.float32)
+        np.add(audio[:, 0], audio[:, 1], out=mono)
+        mono *= 0.5
+    else:
+        mono = np.add.reduce(audio, axis=1, dtype=np.float32)
+        mono *= 1.0 / n_channels
+    return mono
+
+def _noise_sample_range(sr, time_range, total_duration):
+    """将噪声时间范围限制在音频时长内，返回 (起始采样点, 结束采样点)"""
+    start_time: cython.double
+    end_time: cython.double
     start_time, end_time = time_range
     
     # 确保时间范围在有效范围内
     start_time = max(0.0, min(start_time, total_duration - 0.1))
     end_time = max(start_time + 0.1, min(end_time, total_duration))
     
-    start_sample = int(start_time * sr)
-    end_sample = int(end_time * sr)
-    
+    return int(start_time * sr), int(end_time * sr)
+
+def extract_noise_clip(audio, sr, time_range, total_duration):
+    """根据时间范围提取噪声片段"""
+    start_sample, end_sample = _noise_sample_range(sr, time_range, total_duration)
     return audio[start_sample:end_sample]
 
-def process_file(input_path, output_path, profile="default", noise_position="start", noise_duration=1.0):
-    """处理单个音频文件"""
+def _read_noise_clip(f, sr, time_range, total_duration):
+    """根据时间范围从已打开的 SoundFile 中定位并只读取噪声片段 (单声道 float32)"""
+    start_sample, end_sample = _noise_sample_range(sr, time_range, total_duration)
+    f.seek(start_sample)
+    noise_clip = f.read(frames=end_sample - start_sample, dtype="float32", always_2d=True)
+    return _to_mono(noise_clip)
+
+def _output_subtype(info, output_path):
+    """沿用输入文件的编码子类型 (输出格式不支持时返回 None，由 libsndfile 选择默认值)"""
+    fmt = Path(output_path).suffix[1:].upper()
+    if sf.check_format(fmt, info.subtype):
+        return info.subtype
+    return None
+
+# --global-noise-file 指定的全局噪声样本: (噪声数组, 采样率)；工作进程中为共享内存上的视图
+_GLOBAL_NOISE = None
+_GLOBAL_NOISE_SHM = None
+
+def load_noise_file(noise_path):
+    """读取全局噪声样本文件，返回 (float32 单声道数组, 采样率)"""
+    noise_clip, sr = sf.read(str(noise_path), dtype="float32", always_2d=True)
+    return _to_mono(noise_clip), sr
+
+def _set_global_noise(noise_clip, sr):
+    """设置当前进程使用的全局噪声样本"""
+    global _GLOBAL_NOISE
+    _GLOBAL_NOISE = (noise_clip, sr)
+
+def _attach_global_noise(shm_name, shape, dtype, sr):
+    """在工作进程中挂载主进程创建的共享内存，以零拷贝视图作为全局噪声样本"""
+    global _GLOBAL_NOISE_SHM
+    _GLOBAL_NOISE_SHM = shared_memory.SharedMemory(name=shm_name)
+    _set_global_noise(np.ndarray(shape, dtype=dtype, buffer=_GLOBAL_NOISE_SHM.buf), sr)
+
+def process_file(input_path, output_path, profile_key, time_range_fn):
+    """
+    处理单个音频文件，按块流式读取/降噪/写出以限制内存占用。
+    profile_key 为已解析的预设名，time_range_fn 为 compile_time_range 的返回值。
+    """
+    write_path = output_path
     try:
-        # 读取音频文件
-        audio, sr = sf.read(input_path)
-        total_duration = len(audio) / sr
-        
-        # 如果是立体声，转换为单声道
-        if len(audio.shape) > 1:
-            audio = np.mean(audio, axis=1)
-        
-        # 解析噪声位置
-        time_range = parse_time_range(noise_position, total_duration)
-        
-        # 提取噪声样本
-        noise_clip = extract_noise_clip(audio, sr, time_range, total_duration)
-        
-        # 获取预设参数
-        params = PROFILE_SETTINGS.get(profile, PROFILE_SETTINGS["default"])
-        
-        # 应用降噪
-        cleaned_audio = nr.reduce_noise(
-            y=audio,
-            y_noise=noise_clip,
-            sr=sr,
-            **params
-        )
-        
-        # 保存结果
-        sf.write(output_path, cleaned_audio, sr)
+        # 只打开一次输入文件: 先定位读取噪声区域，再回到开头按块流式读取
+        with sf.SoundFile(str(input_path)) as f:
+            sr: cython.int = f.samplerate
+            total_frames: cython.Py_ssize_t = f.frames
+            total_duration: cython.double = total_frames / sr
+            
+            if _GLOBAL_NOISE is not None:
+                # 使用全局噪声样本
+                noise_clip, noise_sr = _GLOBAL_NOISE
+                if noise_sr != sr:
+                    raise ValueError(f"噪声文件采样率 {noise_sr} 与输入采样率 {sr} 不一致")
+            else:
+                # 解析噪声位置
+                time_range = time_range_fn(total_duration)
+                
+                # 提取噪声样本
+                noise_clip = _read_noise_clip(f, sr, time_range, total_duration)
+            f.seek(0)
+            
+            # 分块降噪，相邻块重叠 2*pad 个采样，拼接时各裁掉 pad 以消除块边界效应
+            # 块循环中的长度与下标为 C 整数 (Cython 编译时生效)
+            blocksize: cython.Py_ssize_t
+            pad: cython.Py_ssize_t
+            start: cython.Py_ssize_t
+            stop: cython.Py_ssize_t
+            is_first: cython.bint
+            is_last: cython.bint
+            blocksize, pad = _block_layout(profile_key, sr)
+            offset: cython.Py_ssize_t = 0
+            subtype = _output_subtype(f, output_path)
+            # 整数 PCM 输出预先原地限幅，省去 libsndfile 内部的饱和处理
+            clip_output = subtype is not None and subtype.startswith("PCM")
+            # 输出与输入是同一文件时 (如 -o 指向输入所在目录)，边读边写会截断输入，
+            # 先写入同目录下的临时文件，处理完成后再替换
+            if os.path.exists(output_path) and os.path.samefile(input_path, output_path):
+                fd, write_path = tempfile.mkstemp(suffix=Path(output_path).suffix,
+                                                  dir=Path(output_path).parent)
+                os.close(fd)
+            with sf.SoundFile(str(write_path), "w", samplerate=sr, channels=1,
+                              subtype=subtype) as writer:
+                for block in f.blocks(blocksize=blocksize, overlap=2 * pad,
+                                      dtype="float32", always_2d=True):
+                    is_first = offset == 0
+                    is_last = offset + len(block) >= total_frames
+                    offset += blocksize - 2 * pad
+                    
+                    cleaned = _reduce_noise_cached(_to_mono(block), sr, profile_key, noise_clip)
+                    start = 0 if is_first else pad
+                    stop = len(cleaned) if is_last else len(cleaned) - pad
+                    cleaned = cleaned[start:stop]
+                    if clip_output:
+                        np.clip(cleaned, -1.0, 1.0, out=cleaned)
+                    writer.write(cleaned)
+                    if is_last:
+                        break
+        if write_path != output_path:
+            os.replace(write_path, output_path)
         return True
     except Exception as e:
-        print(f"  处理失败: {str(e)}")
+        tqdm.write(f"  处理失败: {str(e)}")
         return False
+    finally:
+        if write_path != output_path and os.path.exists(write_path):
+            os.remove(write_path)
+
+# 支持的音频文件扩展名 (不区分大小写)
+AUDIO_EXTENSIONS = {'.flac', '.wav', '.mp3', '.ogg', '.aiff'}
+
+def find_audio_files(input_dir, recursive=False):
+    """单次遍历目录收集音频文件，按路径排序以保证顺序确定"""
+    if recursive:
+        walker = os.walk(input_dir)
+    else:
+        with os.scandir(input_dir) as it:
+            files = [entry.name for entry in it if entry.is_file()]
+        walker = [(str(input_dir), [], files)]
+    
+    audio_files = []
+    for root, _, files in walker:
+        for f in files:
+            if os.path.splitext(f)[1].lower() in AUDIO_EXTENSIONS:
+                audio_files.append(Path(root) / f)
+    audio_files.sort()
+    return audio_files
+
+def _worker_init(global_noise=None, numba_threads=None):
+    """
+    工作进程初始化：挂载共享内存中的全局噪声样本 (若有)；限制 numba 线程数 (进程池中每个进程
+    单线程，避免进程数 x 线程数的超额订阅)；若安装了 pyFFTW，则将 scipy.fft 后端切换为 pyFFTW
+    并启用计划缓存，同一进程内形状相同的变换 (同一预设的各个块) 复用首次创建的计划。
+    """
+    if global_noise is not None:
+        _attach_global_noise(*global_noise)
+    if NUMBA_AVAILABLE and numba_threads is not None:
+        numba.set_num_threads(numba_threads)
+    if not PYFFTW_AVAILABLE:
+        return
+    pyfftw.interfaces.cache.enable()
+    pyfftw.interfaces.cache.set_keepalive_time(60)
+    scipy.fft.set_global_backend(pyfftw.interfaces.scipy_fft)
+
+def _process_file_star(task):
+    """
+    解包任务元组并调用 process_file (顶层函数以便进程池序列化)，
+    返回 (输出路径, 是否成功, 耗时) 记录，由主进程在结束后统一输出
+    """
+    start_time = time.time()
+    success = process_file(*task)
+    return task[1], success, time.time() - start_time
 
 def main():
     # 创建命令行参数解析器
@@ -150,7 +553,7 @@ def main():
     parser.add_argument("-i", "--input", help="输入文件或目录路径")
     parser.add_argument("-o", "--output", help="输出目录路径", default="cleaned_audio")
     parser.add_argument("-p", "--profile", 
-                        choices=["footsteps", "rain", "wind", "voice", "default"],
+                        choices=["footsteps", "rain", "wind", "voice", "default", "boxcar"],
                         default="default",
                         help="声音类型预设")
     parser.add_argument("-np", "--noise-position", default="start",
@@ -163,9 +566,25 @@ def main():
                         help="显示详细处理信息")
     parser.add_argument("-t", "--test-noise", action="store_true",
                         help="仅保存噪声样本用于分析")
+    parser.add_argument("-j", "--max-workers", type=int, default=os.cpu_count() or 1,
+                        help="目录处理时的并行进程数")
+    parser.add_argument("--global-noise-file",
+                        help="所有文件共用的噪声样本文件 (忽略 --noise-position)，采样率须与输入一致")
+    parser.add_argument("--skip-existing", action="store_true",
+                        help="跳过输出文件已存在且不早于输入文件的文件")
+    parser.add_argument("--serial", action="store_true",
+                        help="串行处理目录中的文件(便于调试)")
     
     args = parser.parse_args()
     
+    # 预先解析预设与噪声位置，所有文件共用
+    profile_key = args.profile if args.profile in PROFILE_SETTINGS else "default"
+    time_range_fn = compile_time_range(args.noise_position)
+    
+    # 读取全局噪声样本
+    if args.global_noise_file:
+        _set_global_noise(*load_noise_file(args.global_noise_file))
+    
     # 确保输出目录存在
     output_dir = Path(args.output)
     output_dir.mkdir(parents=True, exist_ok=True)
@@ -183,13 +602,7 @@ def main():
         print(f"噪声位置: {args.noise_position}")
         start_time = time.time()
         
-        success = process_file(
-            input_path, 
-            output_path,
-            profile=args.profile,
-            noise_position=args.noise_position,
-            noise_duration=args.noise_duration
-        )
+        success = process_file(input_path, output_path, profile_key, time_range_fn)
         
         if success:
             elapsed = time.time() - start_time
@@ -206,17 +619,7 @@ def main():
         input_dir = Path(args.input)
         
         # 收集所有音频文件
-        audio_files = []
-        extensions = ['.flac', '.wav', '.mp3', '.ogg', '.aiff']
-        
-        if args.recursive:
-            search_pattern = "**/*"
-        else:
-            search_pattern = "*"
-        
-        for ext in extensions:
-            audio_files.extend(input_dir.glob(f"{search_pattern}{ext}"))
-            audio_files.extend(input_dir.glob(f"{search_pattern}{ext.upper()}"))
+        audio_files = find_audio_files(input_dir, args.recursive)
         
         if not audio_files:
             print("❌ 未找到支持的音频文件")
@@ -226,36 +629,98 @@ def main():
         print(f"使用预设: {args.profile}")
         print(f"噪声位置: {args.noise_position}")
         
-        # 处理所有文件
-        success_count = 0
-        for file in tqdm(audio_files, desc="处理进度", unit="文件"):
-            if args.verbose:
-                print(f"\n处理: {file.name}")
-            
+        # 构建任务列表，每个输入子目录对应的输出目录只计算一次
+        tasks = []
+        n_skipped = 0
+        out_dirs = {}
+        for file in audio_files:
             if args.test_noise:
                 output_filename = f"noise_sample_{file.name}"
             else:
                 output_filename = f"{file.name}"
             
-            output_path = output_dir / file.relative_to(input_dir).parent / output_filename
-            output_path.parent.mkdir(parents=True, exist_ok=True)
+            out_dir = out_dirs.get(file.parent)
+            if out_dir is None:
+                out_dir = out_dirs[file.parent] = output_dir / file.relative_to(input_dir).parent
+            output_path = out_dir / output_filename
             
-            success = process_file(
-                file, 
-                output_path,
-                profile=args.profile,
-                noise_position=args.noise_position,
-                noise_duration=args.noise_duration
-            )
+            # 输出文件已存在且不早于输入文件时跳过
+            if (args.skip_existing and output_path.exists()
+                    and output_path.stat().st_mtime >= file.stat().st_mtime):
+                n_skipped += 1
+                continue
             
-            if success:
-                success_count += 1
-                if args.verbose:
-                    print(f"  保存到: {output_path}")
-            elif args.verbose:
-                print(f"  处理失败")
+            tasks.append((file, output_path, profile_key, time_range_fn))
+        
+        # 并行且待处理文件较多时按文件大小降序排列 (LPT 调度)，并逐个分发任务，
+        # 让空闲进程用小文件补齐，避免最长的文件落在最后拖长总耗时。
+        # 在跳过已处理文件之后决定，只对实际要处理的文件取大小；不足两个任务时不启动进程池
+        parallel = not args.serial and args.max_workers > 1 and len(tasks) > 1
+        balance_by_size = parallel and len(tasks) > 2 * args.max_workers
+        if balance_by_size:
+            tasks.sort(key=lambda task: -task[0].stat().st_size)
+        
+        # 按层级由浅到深一次性创建所需的输出目录，避免逐文件 mkdir 及进程间的竞争
+        for d in sorted({task[1].parent for task in tasks}, key=lambda p: len(p.parts)):
+            d.mkdir(parents=True, exist_ok=True)
+        
+        if n_skipped:
+            print(f"跳过 {n_skipped} 个已处理文件")
+        
+        # 处理所有文件
+        # 降低进度条刷新频率；stderr 不是终端 (重定向到日志/CI) 时不显示进度条
+        progress_kwargs = {
+            "total": len(tasks),
+            "desc": "处理进度",
+            "unit": "文件",
+            "mininterval": 0.5,
+            "miniters": max(1, len(tasks) // 200),
+            "smoothing": 0,
+            "dynamic_ncols": True,
+            "disable": not sys.stderr.isatty(),
+        }
+        if not parallel:
+            _worker_init()
+            results = [_process_file_star(task)
+                       for task in tqdm(tasks, **progress_kwargs)]
+        else:
+            # 全局噪声样本只在共享内存中保存一份，各工作进程挂载后零拷贝使用
+            shm = None
+            shm_args = None
+            try:
+                if _GLOBAL_NOISE is not None:
+                    noise_clip, noise_sr = _GLOBAL_NOISE
+                    shm = shared_memory.SharedMemory(create=True, size=noise_clip.nbytes)
+                    buf = np.ndarray(noise_clip.shape, dtype=noise_clip.dtype, buffer=shm.buf)
+                    buf[:] = noise_clip
+                    shm_args = (shm.name, noise_clip.shape, noise_clip.dtype.str, noise_sr)
+                
+                with ProcessPoolExecutor(max_workers=args.max_workers,
+                                         initializer=_worker_init,
+                                         initargs=(shm_args, 1)) as executor:
+                    results = list(tqdm(
+                        executor.map(
+                            _process_file_star,
+                            tasks,
+                            chunksize=1 if balance_by_size
+                            else max(1, len(tasks) // (args.max_workers * 8))
+                        ),
+                        **progress_kwargs
+                    ))
+            finally:
+                if shm is not None:
+                    shm.close()
+                    shm.unlink()
+        
+        if args.verbose:
+            for output_path, success, elapsed in results:
+                if success:
+                    print(f"  保存到: {output_path} ({elapsed:.2f}秒)")
+                else:
+                    print(f"  处理失败: {output_path}")
+        success_count = sum(success for _, success, _ in results)
         
-        print(f"\n🎉 处理完成! 成功: {success_count}/{len(audio_files)}")
+        print(f"\n🎉 处理完成! 成功: {success_count}/{len(tasks)}")
         print(f"输出目录: {output_dir}")
     
     else:
@@ -1,8 +1,29 @@
+import os
+
 from setuptools import find_packages, setup
 
 with open("README.md", "r") as fh:
     long_description = fh.read()
 
+# Optionally compile the audio_denoise.py CLI with Cython (pure Python mode)
+# to cut interpreter overhead in batch orchestration. Opt-in so that Cython
+# is never a build requirement of the library itself:
+#   NOISEREDUCE_CYTHONIZE_CLI=1 python setup.py build_ext --inplace
+# _denoise_kernels.py is deliberately left out: numba can only JIT functions
+# that still have Python bytecode.
+ext_modules = []
+if os.environ.get("NOISEREDUCE_CYTHONIZE_CLI"):
+    from Cython.Build import cythonize
+
+    ext_modules = cythonize(
+        ["audio_denoise.py"],
+        compiler_directives={
+            "language_level": 3,
+            "boundscheck": False,
+            "infer_types": True,
+        },
+    )
+
 setup(
     name="noisereduce",
     packages=find_packages(),
@@ -21,6 +42,7 @@ setup(
         "Topic :: Education",
         "Topic :: Scientific/Engineering",
     ],
+    ext_modules=ext_modules,
     install_requires=["scipy", "matplotlib", "numpy", "tqdm", "joblib"],
     extras_require={
         "PyTorch": ["torch>=1.9.0"],
@@ -0,0 +1,298 @@
+import functools
+import multiprocessing
+import os
+import sys
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+import soundfile as sf
+from scipy.signal import stft
+from scipy.io import wavfile
+import noisereduce as nr
+from noisereduce.generate_noise import band_limited_noise
+from noisereduce.spectralgate.utils import _amp_to_db
+import audio_denoise as ad
+
+
+def _noisy_fish():
+    # load data
+    wav_loc = "assets/fish.wav"
+    rate, data = wavfile.read(wav_loc)
+    data = data.astype(np.float32) / 32768
+
+    # add noise (band_limited_noise draws from the global RNG)
+    np.random.seed(0)
+    noise = band_limited_noise(
+        min_freq=2000, max_freq=12000, samples=len(data), samplerate=rate) * 10
+    return (data + noise).astype(np.float32), rate
+
+
+def _assert_close_to_reference(cleaned, expected):
+    # the float32 fork can flip a few threshold decisions right at the
+    # threshold compared with float64 nr.reduce_noise; each flip only
+    # perturbs the smoothed mask locally
+    peak = np.max(np.abs(expected))
+    diff = np.abs(cleaned - expected)
+    assert np.max(diff) <= 1e-3 * peak
+    assert np.mean(diff > 1e-5 * peak) <= 0.05
+
+
+def test_reduce_noise_cached_matches_reduce_noise():
+    audio, rate = _noisy_fish()
+    noise_clip = audio[:rate]
+    for profile, params in ad.PROFILE_SETTINGS.items():
+        if not params["stationary"]:
+            continue
+        if "window" in params:
+            # nr.reduce_noise only supports the default hann window
+            continue
+        expected = nr.reduce_noise(y=audio, y_noise=noise_clip, sr=rate, **params)
+        cleaned = ad._reduce_noise_cached(audio, rate, profile, noise_clip)
+        assert cleaned.shape == expected.shape
+        _assert_close_to_reference(cleaned, expected)
+
+
+def test_process_file_streamed_matches_single_shot(tmp_path):
+    audio, rate = _noisy_fish()
+    for profile in ["default", "rain"]:
+        # make the file span several streaming blocks
+        blocksize, pad = ad._block_layout(profile, rate)
+        n_samples = 2 * blocksize
+        long_audio = np.tile(audio, n_samples // len(audio) + 1)[:n_samples] * 0.3
+
+        input_path = tmp_path / f"{profile}_in.wav"
+        output_path = tmp_path / f"{profile}_out.wav"
+        sf.write(input_path, long_audio, rate, subtype="FLOAT")
+        assert ad.process_file(
+            input_path, output_path, profile, ad.compile_time_range("start"))
+
+        streamed, _ = sf.read(output_path, dtype="float32")
+        expected = ad._reduce_noise_cached(
+            long_audio, rate, profile, long_audio[:rate])
+        assert streamed.shape == expected.shape
+        peak = np.max(np.abs(expected))
+        if ad.PROFILE_SETTINGS[profile]["stationary"]:
+            np.testing.assert_allclose(streamed, expected, atol=1e-5 * peak)
+        else:
+            # the noise floor's IIR smoothing has not fully settled one time
+            # constant into a block, leaving small errors around the seams
+            diff = np.abs(streamed - expected)
+            assert np.max(diff) <= 0.1 * peak
+            assert np.sqrt(np.mean(diff ** 2)) <= 5e-3 * peak
+
+
+def test_compile_time_range():
+    total = 20.0
+    assert ad.compile_time_range("start")(total) == (0.0, 1.0)
+    assert ad.compile_time_range("END")(total) == (19.0, 20.0)
+    assert ad.compile_time_range("5%")(total) == (0.0, 1.0)
+    assert ad.compile_time_range("5 %")(total) == (0.0, 1.0)
+    assert ad.compile_time_range("10.5-12.0")(total) == (10.5, 12.0)
+    assert ad.compile_time_range("10.5 - 12.0")(total) == (10.5, 12.0)
+    assert ad.compile_time_range("1e-1-2")(total) == (0.1, 2.0)
+    assert ad.compile_time_range("3")(total) == (3.0, 4.0)
+    assert ad.compile_time_range("1e1")(total) == (10.0, 11.0)
+    assert ad.compile_time_range(".5")(total) == (0.5, 1.5)
+    # unparseable input falls back to the first second
+    assert ad.compile_time_range("middle")(total) == (0.0, 1.0)
+    assert ad.compile_time_range("1-")(total) == (0.0, 1.0)
+    assert ad.parse_time_range("10.5-12.0", total) == (10.5, 12.0)
+
+
+def test_find_audio_files(tmp_path):
+    (tmp_path / "sub" / "deeper").mkdir(parents=True)
+    names = ["b.WAV", "a.wav", "c.Flac", "notes.txt", "sub/d.mp3",
+             "sub/deeper/e.AIFF", "sub/readme.md"]
+    for name in names:
+        (tmp_path / name).touch()
+    # directories with audio-like names are not files
+    (tmp_path / "dir.wav").mkdir()
+
+    flat = ad.find_audio_files(tmp_path)
+    assert flat == [tmp_path / "a.wav", tmp_path / "b.WAV", tmp_path / "c.Flac"]
+
+    recursive = ad.find_audio_files(tmp_path, recursive=True)
+    assert recursive == sorted([
+        tmp_path / "a.wav", tmp_path / "b.WAV", tmp_path / "c.Flac",
+        tmp_path / "sub" / "d.mp3", tmp_path / "sub" / "deeper" / "e.AIFF",
+    ])
+
+
+def test_reduce_noise_cached_numpy_fallback(monkeypatch):
+    audio, rate = _noisy_fish()
+    noise_clip = audio[:rate]
+    expected = ad._reduce_noise_cached(audio, rate, "default", noise_clip)
+    monkeypatch.setattr(ad, "NUMBA_AVAILABLE", False)
+    cleaned = ad._reduce_noise_cached(audio, rate, "default", noise_clip)
+    np.testing.assert_allclose(cleaned, expected, atol=1e-5)
+
+
+def test_stft_matches_scipy():
+    audio, _ = _noisy_fish()
+    for profile_key, params in ad.PROFILE_SETTINGS.items():
+        for pad in [0, 1000]:
+            expected = stft(np.pad(audio, pad), padded=False,
+                            **ad._stft_kwargs(params))[2]
+            # _stft returns the (frames, bins) layout
+            S = ad._stft(audio, params, pad=pad)
+            assert S.dtype == np.complex64, profile_key
+            np.testing.assert_allclose(S.T, expected, atol=1e-6, err_msg=profile_key)
+            np.testing.assert_allclose(
+                ad._stft_db(S).T, _amp_to_db(expected, eps=ad._DB_EPS),
+                atol=1e-3, err_msg=profile_key)
+
+
+def test_read_noise_clip_matches_extract_noise_clip(tmp_path):
+    rate = 8000
+    audio = np.random.RandomState(0).uniform(-0.5, 0.5, (rate * 3, 2)).astype(np.float32)
+    path = tmp_path / "stereo.wav"
+    sf.write(str(path), audio, rate, subtype="FLOAT")
+    mono = audio.mean(axis=1)
+    for time_range in [(0.0, 1.0), (1.5, 2.25), (2.0, 10.0), (5.0, 6.0)]:
+        expected = ad.extract_noise_clip(mono, rate, time_range, 3.0)
+        with sf.SoundFile(str(path)) as f:
+            clip = ad._read_noise_clip(f, rate, time_range, 3.0)
+        np.testing.assert_allclose(clip, expected, atol=1e-7)
+
+
+def test_process_file_in_place(tmp_path):
+    audio, rate = _noisy_fish()
+    audio = audio[:rate * 3] * 0.3
+    input_path = tmp_path / "in_place.wav"
+    sf.write(input_path, audio, rate, subtype="FLOAT")
+    time_range_fn = ad.compile_time_range("start")
+
+    assert ad.process_file(input_path, tmp_path / "copy.wav", "default", time_range_fn)
+    # writing over the input must not truncate it before it is read
+    assert ad.process_file(input_path, input_path, "default", time_range_fn)
+
+    expected, _ = sf.read(tmp_path / "copy.wav", dtype="float32")
+    in_place, _ = sf.read(input_path, dtype="float32")
+    assert np.any(in_place)
+    np.testing.assert_array_equal(in_place, expected)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["copy.wav", "in_place.wav"]
+
+
+def test_noise_profile_cache_does_not_keep_noise_clips():
+    audio, rate = _noisy_fish()
+    refs = []
+    for start in range(5):
+        noise_clip = audio[start * 1000:start * 1000 + rate].copy()
+        refs.append(weakref.ref(noise_clip))
+        ad._reduce_noise_cached(audio[:rate * 2], rate, "default", noise_clip)
+        # an equal clip from a different array hits the cache
+        key = ("default", rate, ad._noise_digest(noise_clip.copy()))
+        assert key in ad._NOISE_PROFILE_CACHE
+        del noise_clip
+    assert all(ref() is None for ref in refs)
+
+
+def _write_batch(directory, rate, n_files=3, seconds=2):
+    audio, fish_rate = _noisy_fish()
+    step = fish_rate // rate
+    directory.mkdir()
+    for i in range(n_files):
+        clip = audio[i * rate:(i + seconds) * rate * step:step] * 0.3
+        sf.write(directory / f"clip{i}.wav", clip, rate, subtype="FLOAT")
+
+
+def _run_main(monkeypatch, *args):
+    monkeypatch.setattr(sys, "argv", ["audio_denoise.py", *args])
+    ad.main()
+
+
+def test_global_noise_file_parallel_matches_serial(tmp_path, monkeypatch):
+    # main() installs the global noise in this process; restore it afterwards
+    monkeypatch.setattr(ad, "_GLOBAL_NOISE", None)
+    rate = 16000
+    _write_batch(tmp_path / "in", rate)
+    noise = np.random.RandomState(1).uniform(-0.01, 0.01, rate).astype(np.float32)
+    sf.write(tmp_path / "noise.wav", noise, rate, subtype="FLOAT")
+
+    created = []
+
+    class RecordingSharedMemory(shared_memory.SharedMemory):
+        def __init__(self, *args, create=False, **kwargs):
+            super().__init__(*args, create=create, **kwargs)
+            if create:
+                created.append(self.name)
+
+    monkeypatch.setattr(ad.shared_memory, "SharedMemory", RecordingSharedMemory)
+    # earlier tests have started numba's worker threads in this process, which
+    # must not be forked; the CLI itself never runs kernels before the pool starts
+    monkeypatch.setattr(ad, "ProcessPoolExecutor", functools.partial(
+        ProcessPoolExecutor, mp_context=multiprocessing.get_context("spawn")))
+    common = ["-i", str(tmp_path / "in"), "--global-noise-file", str(tmp_path / "noise.wav")]
+    _run_main(monkeypatch, *common, "-o", str(tmp_path / "serial"), "--serial")
+    assert created == []
+    _run_main(monkeypatch, *common, "-o", str(tmp_path / "parallel"), "-j", "2")
+
+    # the parallel run shared the noise through one segment, unlinked afterwards
+    assert len(created) == 1
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=created[0])
+
+    for i in range(3):
+        serial, _ = sf.read(tmp_path / "serial" / f"clip{i}.wav", dtype="float32")
+        parallel, _ = sf.read(tmp_path / "parallel" / f"clip{i}.wav", dtype="float32")
+        assert np.any(serial)
+        np.testing.assert_allclose(parallel, serial, atol=1e-6)
+
+
+def test_global_noise_sample_rate_mismatch(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(ad, "_GLOBAL_NOISE", None)
+    _write_batch(tmp_path / "in", 16000, n_files=1)
+    ad._set_global_noise(np.zeros(8000, dtype=np.float32), 8000)
+    assert not ad.process_file(tmp_path / "in" / "clip0.wav", tmp_path / "out.wav",
+                               "default", ad.compile_time_range("start"))
+    assert "8000" in capsys.readouterr().out
+    assert not (tmp_path / "out.wav").exists()
+
+
+def test_attach_global_noise(monkeypatch):
+    monkeypatch.setattr(ad, "_GLOBAL_NOISE", None)
+    monkeypatch.setattr(ad, "_GLOBAL_NOISE_SHM", None)
+    noise = np.arange(100, dtype=np.float32)
+    shm = shared_memory.SharedMemory(create=True, size=noise.nbytes)
+    try:
+        np.ndarray(noise.shape, dtype=noise.dtype, buffer=shm.buf)[:] = noise
+        ad._worker_init((shm.name, noise.shape, noise.dtype.str, 16000))
+        attached, sr = ad._GLOBAL_NOISE
+        assert sr == 16000
+        np.testing.assert_array_equal(attached, noise)
+        del attached
+        ad._GLOBAL_NOISE = None
+        ad._GLOBAL_NOISE_SHM.close()
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def test_skip_existing(tmp_path, monkeypatch):
+    _write_batch(tmp_path / "in", 16000)
+    processed = []
+    process_file = ad.process_file
+
+    def recording_process_file(input_path, *args):
+        processed.append(input_path.name)
+        return process_file(input_path, *args)
+
+    monkeypatch.setattr(ad, "process_file", recording_process_file)
+    args = ["-i", str(tmp_path / "in"), "-o", str(tmp_path / "out"),
+            "--serial", "--skip-existing"]
+    _run_main(monkeypatch, *args)
+    assert sorted(processed) == ["clip0.wav", "clip1.wav", "clip2.wav"]
+
+    # everything is up to date
+    processed.clear()
+    _run_main(monkeypatch, *args)
+    assert processed == []
+
+    # an input modified after its output was written is processed again
+    output_mtime = (tmp_path / "out" / "clip1.wav").stat().st_mtime
+    os.utime(tmp_path / "in" / "clip1.wav", (output_mtime + 10, output_mtime + 10))
+    _run_main(monkeypatch, *args)
+    assert processed == ["clip1.wav"]